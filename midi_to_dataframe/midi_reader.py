@@ -1,8 +1,8 @@
 import logging
 import python3_midi
+import numpy as np
 import pandas as pd
 from collections import defaultdict
-from collections import OrderedDict
 from enum import Enum
 from collections import namedtuple
 
@@ -20,6 +20,9 @@ IDENTIFIER_DENOMINATOR = "denominator"
 IDENTIFIER_BPM = "bpm"
 IDENTIFIER_RESOLUTION = "resolution"
 
+# MIDI event types carrying notes
+NOTE_EVENT_TYPES = (python3_midi.NoteOnEvent, python3_midi.NoteOffEvent)
+
 
 class NoteLength(Enum):
     """
@@ -35,6 +38,14 @@ class NoteLength(Enum):
 DEFAULT_DURATION_QUANTIZATION = NoteLength.SIXTEENTH.value
 DEFAULT_TIMING_QUANTIZATION = NoteLength.SIXTEENTH.value
 
+# Number of quantization steps per whole note, by quantization value
+STEPS_PER_WHOLE_NOTE = {
+    NoteLength.THIRTY_SECOND.value: 32,
+    NoteLength.SIXTEENTH.value: 16,
+    NoteLength.EIGHTH.value: 8,
+    NoteLength.QUARTER.value: 4
+}
+
 
 class MidiReader(object):
     """
@@ -59,10 +70,10 @@ class MidiReader(object):
         self._resolution = 120
 
         # Time signature changes, stored by timestamp
-        self._time_signature_by_timestamp = OrderedDict()
+        self._time_signature_by_timestamp = {}
 
         # Tempo/BPM changes, stored by timestamp
-        self._bpm_by_timestamp = OrderedDict()
+        self._bpm_by_timestamp = {}
 
         # Text representation of extracted notes, stored by timestamp
         self._text_sequence = defaultdict(list)
@@ -70,6 +81,18 @@ class MidiReader(object):
         # Temporary data store used during MIDI file to dataframe conversion
         self._on_notes = {}
 
+        # Notes played, stored as (start tick, duration in ticks, MIDI note, program) tuples
+        self._played_notes = []
+
+        # Handlers for the types of MIDI events that are processed
+        self._event_handlers = {
+            python3_midi.NoteOnEvent: self._process_note_on_event,
+            python3_midi.NoteOffEvent: self._process_note_off_event,
+            python3_midi.TimeSignatureEvent: self._process_time_signature_event,
+            python3_midi.SetTempoEvent: self._process_tempo_event,
+            python3_midi.ProgramChangeEvent: self._process_program_change_event
+        }
+
         # Properties to extract from MIDI files
         self._extract_timestamp = True
         self._extract_bpm = True
@@ -120,87 +143,108 @@ class MidiReader(object):
         timestamp_sequence = self._create_timestamp_sequence(self._text_sequence, timing_quantization_ticks)
 
         # Check number of timestamp entries
-        (max_timestamp, _) = max(self._text_sequence.items())
+        max_timestamp = max(self._text_sequence)
         if max_timestamp > 10000000:  # More than this becomes painfully slow...
             self._logger.error("Unable to process MIDI file (too many timestamps): " + path)
             self._reset_intermediary_variables()
             return pd.DataFrame()
 
-        # Fill in blank beats, according to configured timing quantization rate
-        for i in range(0, (max_timestamp + timing_quantization_ticks), timing_quantization_ticks):
-            if i not in timestamp_sequence:
-                timestamp_sequence[i] = REST
-
-        data_rows = []
+        # Lay out all beats according to configured timing quantization rate, with blank beats filled in as rests
+        timestamps = np.arange(0, max_timestamp + timing_quantization_ticks, timing_quantization_ticks,
+                               dtype=np.int64)
+        notes_column = np.full(len(timestamps), REST, dtype=object)
+        filled_timestamps = np.fromiter(timestamp_sequence.keys(), dtype=np.int64, count=len(timestamp_sequence))
+        notes_column[filled_timestamps // timing_quantization_ticks] = np.array(
+            [','.join(notes) for notes in timestamp_sequence.values()], dtype=object)
 
-        measure = 1
-        current_beat = 1
-        time_sig = None
-        for (index, (timestamp, notes)) in enumerate(sorted(timestamp_sequence.items())):
-
-            row = {'notes': notes}
-
-            # Extract current time index
-            if self._extract_timestamp:
-                row['timestamp'] = timestamp
+        # Look up the BPM and time signature in effect at each time index
+        if self._extract_bpm:
+            bpm_timestamps = sorted(self._bpm_by_timestamp)
+            bpm_indices = self._get_change_indices(timestamps, bpm_timestamps)
+            bpms = np.array([self._bpm_by_timestamp[t] for t in bpm_timestamps])[bpm_indices]
+        time_sig_timestamps = sorted(self._time_signature_by_timestamp)
+        time_sig_values = [self._time_signature_by_timestamp[t] for t in time_sig_timestamps]
+        time_sig_indices = self._get_change_indices(timestamps, time_sig_timestamps)
+        if self._extract_time_signature:
+            time_sig_labels = [str(time_sig.numerator) + "/" + str(time_sig.denominator)
+                               for time_sig in time_sig_values]
+            time_signatures = np.array(time_sig_labels, dtype=object)[time_sig_indices]
 
-            # Extract BPM at time index
-            if self._extract_bpm:
-                row['bpm'] = self._get_value_at_timestamp(self._bpm_by_timestamp, timestamp)
+        # Count the measure and beat of each time index
+        if self._extract_measure or self._extract_beat:
+            numerators = np.array([time_sig.numerator for time_sig in time_sig_values])[time_sig_indices]
+            denominators = np.array([time_sig.denominator for time_sig in time_sig_values])[time_sig_indices]
+            (measures, beats) = self._count_measures_and_beats(numerators, denominators)
 
-            # Extract time signature at time index
-            prev_time_sig = time_sig
-            time_sig = self._get_value_at_timestamp(self._time_signature_by_timestamp, timestamp)
-            if self._extract_time_signature:
-                row['time_signature'] = str(time_sig.numerator) + "/" + str(time_sig.denominator)
+        # Since extraction is complete, reset all internal variables
+        self._reset_intermediary_variables()
 
-            # FIXME measure counts are wrong if quantization rate < time signature denominator
-            # TODO refactor
-            modifier = 1
-            if self._timing_quantization_ratio == NoteLength.THIRTY_SECOND.value:
-                modifier = 32 / time_sig.denominator
-            elif self._timing_quantization_ratio == NoteLength.SIXTEENTH.value:
-                modifier = 16 / time_sig.denominator
-            elif self._timing_quantization_ratio == NoteLength.EIGHTH.value:
-                modifier = 8 / time_sig.denominator
-            elif self._timing_quantization_ratio == NoteLength.QUARTER.value:
-                modifier = 4 / time_sig.denominator
-            total_beat_units = (index / modifier)
+        # Create Data Frame from the extracted columns, in the expected column order. All columns are NumPy arrays of
+        # their final type, so they can be used without inference or copying
+        columns = {}
+        if self._extract_timestamp:
+            columns['timestamp'] = timestamps
+        if self._extract_bpm:
+            columns['bpm'] = bpms
+        if self._extract_time_signature:
+            columns['time_signature'] = time_signatures
+        if self._extract_measure:
+            columns['measure'] = measures
+        if self._extract_beat:
+            columns['beat'] = beats
+        columns['notes'] = notes_column
 
-            if self._timing_quantization_ratio == NoteLength.QUARTER.value:
-                total_beat_units *= 2
+        return pd.DataFrame(columns, copy=False)
 
-            # Count number of beats so far this measure
-            if total_beat_units > 0 and total_beat_units.is_integer():
-                current_beat += 1
+    def _count_measures_and_beats(self, numerators, denominators):
+        """
+        Counts the current measure and beat of each time index in a sequence quantized at the configured timing
+        quantization rate.
+        :param numerators: the time signature numerator in effect at each time index.
+        :param denominators: the time signature denominator in effect at each time index.
+        :return: a tuple: (measure of each time index, beat within the measure of each time index).
+        """
 
-            # Count number of measures, reset current beat when measure increases
-            if current_beat > time_sig.numerator or (prev_time_sig is not None and prev_time_sig != time_sig):
-                measure += 1
-                current_beat = 1
+        # Number of quantization steps per whole note, used to convert time indices to beat units (the timing
+        # quantization rate is constant throughout the file, so this is looked up once rather than per time index)
+        steps_per_whole_note = STEPS_PER_WHOLE_NOTE.get(self._timing_quantization_ratio)
+        beat_units_scale = 2 if self._timing_quantization_ratio == NoteLength.QUARTER.value else 1
 
-            beat = current_beat + total_beat_units % 1
+        # FIXME measure counts are wrong if quantization rate < time signature denominator
+        num_indices = len(numerators)
+        modifiers = np.ones(num_indices)
+        if steps_per_whole_note is not None:
+            modifiers = steps_per_whole_note / denominators
+        total_beat_units = (np.arange(num_indices) / modifiers) * beat_units_scale
 
-            # Set current measure
-            if self._extract_measure:
-                row['measure'] = measure
+        # A new beat is counted at every whole number of beat units
+        is_new_beat = (total_beat_units > 0) & (total_beat_units % 1 == 0)
 
-            # Set current beat
-            if self._extract_beat:
-                row['beat'] = beat
+        # Split the sequence into segments of constant time signature
+        time_sig_changes = np.flatnonzero((numerators[1:] != numerators[:-1]) |
+                                          (denominators[1:] != denominators[:-1])) + 1
+        segment_starts = np.concatenate(([0], time_sig_changes))
+        segment_ends = np.concatenate((time_sig_changes, [num_indices])) - 1
+        is_segment_start = np.zeros(num_indices, dtype=np.int64)
+        is_segment_start[time_sig_changes] = 1
+        segment_ids = np.cumsum(is_segment_start)
 
-            data_rows.append(row)
+        # Count the beats since the start of each segment, which always starts a new measure
+        beat_counts = np.cumsum(is_new_beat)
+        beats_in_segment = beat_counts - beat_counts[segment_starts][segment_ids]
 
-        # Since extraction is complete, reset all internal variables
-        self._reset_intermediary_variables()
+        # Start a new measure every time the number of beats exceeds the time signature numerator
+        measures_in_segment = beats_in_segment // numerators
+        current_beats = beats_in_segment % numerators + 1
 
-        # Create Data Frame from rows, stored as dictionaries
-        dataframe = pd.DataFrame.from_dict(data_rows, orient='columns')
+        # Each segment starts one measure after the last measure of the previous segment
+        measures_per_segment = measures_in_segment[segment_ends] + 1
+        first_measures = 1 + np.concatenate(([0], np.cumsum(measures_per_segment)[:-1]))
+        measures = (first_measures[segment_ids] + measures_in_segment).astype(np.int64)
 
-        # Put columns into correct order
-        dataframe = self._reorder_cols(dataframe)
+        beats = current_beats + total_beat_units % 1
 
-        return dataframe
+        return measures, beats
 
     def _extract_text_sequence(self, pattern):
         """
@@ -210,6 +254,9 @@ class MidiReader(object):
         :return: None.
         """
 
+        # Bind the handler lookup locally, since it is used for every MIDI event
+        get_handler = self._event_handlers.get
+
         # Process each track of the input file in sequence
         for track in pattern:
 
@@ -217,10 +264,29 @@ class MidiReader(object):
             # The program is a number that defines the instrument playing on the track
             current_program = None
 
-            # Process all MIDI events in the track and store textual representation in self.text_sequence
+            # Process all MIDI events in the track and record the notes played in self.played_notes
             for event in track:
+
+                # Skip events of types without a handler straight away
+                # TODO: not currently handled: pitch changes, control changes, ...
+                event_type = type(event)
+                handler = get_handler(event_type)
+                if handler is None:
+                    continue
+
+                if event_type in NOTE_EVENT_TYPES:
+                    # Set program for drums, since this is set by channel and not explicitly
+                    if event.channel == MIDI_DRUM_CHANNEL:
+                        current_program = DEFAULT_MIDI_PROGRAM_NUM
+                    elif current_program is None:
+                        # If program was never set, default to 1 (Piano)
+                        current_program = 1
+
                 # Updates current_program, since this may have been changed by the event
-                current_program = self._process_midi_event(event, current_program)
+                current_program = handler(event, current_program)
+
+        # Store the textual representation of all played notes in self.text_sequence
+        self._convert_played_notes()
 
         # In case BPM and Tempo were not set explicitly, assume MIDI defaults:
         if len(self._time_signature_by_timestamp) == 0:
@@ -234,65 +300,82 @@ class MidiReader(object):
         Create a single (timestamp, notes) mapping out of extracted note information.
         :param text_sequence: the extracted notes.
         :param timing_quantization_ticks: the quantization factor to use, in MIDI ticks.
-        :return: a single (timestamp, notes) mapping of all extracted notes.
+        :return: a single (timestamp, notes) mapping of all extracted notes, with the notes of each timestamp stored
+        as a list.
         """
-        timestamp_sequence = {}
-        for (timestamp, notes) in sorted(text_sequence.items()):
+        timestamp_sequence = defaultdict(list)
+        for timestamp in sorted(text_sequence):
+            notes = text_sequence[timestamp]
 
             if len(notes) > 0:
 
                 # TODO why round down?
-                timestamp = MidiReader._round_down(timestamp, timing_quantization_ticks)
-
-                # Store notes as comma-separated string
-                note_string = ','.join(list(notes))
+                rounded_timestamp = MidiReader._round_down(timestamp, timing_quantization_ticks)
 
-                if timestamp in timestamp_sequence:
-                    # If an entry already exists for the timestamp, append the notes to it
-                    timestamp_sequence[timestamp] += ',' + note_string
-                else:
-                    # ...otherwise, create a new entry
-                    timestamp_sequence[timestamp] = note_string
+                # Append the notes to any notes already stored for the (rounded) timestamp
+                timestamp_sequence[rounded_timestamp].extend(notes)
 
         return timestamp_sequence
 
-    def _process_midi_event(self, event, program):
+    def _process_note_on_event(self, event, program):
         """
-        Processes a MIDI event played by a given MIDI program.
-        :param event: the MIDI event to process.
+        Processes a MIDI Note On event.
+        :param event: the Note On event to process.
         :param program: the current program of the MIDI track the event occurred on.
-        :return: the updated program of the MIDI track (since this may have been updated by the MIDI event).
+        :return: the program of the MIDI track (unchanged).
         """
 
-        # Set program for drums, since this is set by channel and not explicitly
-        if (type(event) == python3_midi.NoteOnEvent or type(event) == python3_midi.NoteOffEvent) and event.channel == MIDI_DRUM_CHANNEL:
-            program = DEFAULT_MIDI_PROGRAM_NUM
-        elif (type(event) == python3_midi.NoteOnEvent or type(event) == python3_midi.NoteOffEvent) and program is None:
-            # If program was never set, default to 1 (Piano)
-            program = 1
-
         # True Note On events have positive velocity
-        if type(event) == python3_midi.NoteOnEvent and event.velocity > 0:
+        if event.velocity > 0:
             self._on_notes[event.pitch] = (event.tick, event)
         # Some sequences pass Note Off events encoded as a Note On event with 0 velocity
-        elif type(event) == python3_midi.NoteOffEvent or type(event) == python3_midi.NoteOnEvent and event.velocity == 0:
+        elif event.velocity == 0:
             self._process_note_off(event.pitch, program, event.tick)
-        elif type(event) == python3_midi.TimeSignatureEvent:
-            self._time_signature_by_timestamp[event.tick] = TimeSignature(event.get_numerator(),
-                                                                          event.get_denominator())
-        elif type(event) == python3_midi.SetTempoEvent:
-            self._bpm_by_timestamp[event.tick] = event.get_bpm()
-        elif type(event) == python3_midi.ProgramChangeEvent:
-            program = event.value
-        else:
-            # TODO: not currently handled: pitch changes, control changes, ...
-            pass
+        return program
+
+    def _process_note_off_event(self, event, program):
+        """
+        Processes a MIDI Note Off event.
+        :param event: the Note Off event to process.
+        :param program: the current program of the MIDI track the event occurred on.
+        :return: the program of the MIDI track (unchanged).
+        """
+        self._process_note_off(event.pitch, program, event.tick)
+        return program
+
+    def _process_time_signature_event(self, event, program):
+        """
+        Processes a MIDI Time Signature event by recording the time signature change.
+        :param event: the Time Signature event to process.
+        :param program: the current program of the MIDI track the event occurred on.
+        :return: the program of the MIDI track (unchanged).
+        """
+        self._time_signature_by_timestamp[event.tick] = TimeSignature(event.get_numerator(), event.get_denominator())
+        return program
 
+    def _process_tempo_event(self, event, program):
+        """
+        Processes a MIDI Set Tempo event by recording the BPM change.
+        :param event: the Set Tempo event to process.
+        :param program: the current program of the MIDI track the event occurred on.
+        :return: the program of the MIDI track (unchanged).
+        """
+        self._bpm_by_timestamp[event.tick] = event.get_bpm()
         return program
 
+    @staticmethod
+    def _process_program_change_event(event, program):
+        """
+        Processes a MIDI Program Change event.
+        :param event: the Program Change event to process.
+        :param program: the current program of the MIDI track the event occurred on.
+        :return: the new program of the MIDI track.
+        """
+        return event.value
+
     def _process_note_off(self, note, program_num, current_tick):
         """
-        Processes a note off message by adding a textual representation of the note to this instance's text sequence.
+        Processes a note off message by recording the note played to this instance's played notes.
         :param note: the MIDI note being turned off.
         :param program_num: the program the note was played with.
         :param current_tick: the absolute MIDI tick timestamp when the note off message was encountered.
@@ -308,33 +391,66 @@ class MidiReader(object):
 
             # Ensure note was actually played
             if duration > 0:
+                # Record the note as plain integers; it is converted to its textual representation once all MIDI
+                # events have been processed
+                self._played_notes.append((start_tick, duration, note, program_num))
 
-                # Convert duration from ticks to quarter notes
-                duration = duration / self._resolution
+            # Remove from on notes
+            del self._on_notes[note]
 
-                # Round duration to nearest step defined for instrument
-                instrument = self._note_mapper.get_program_name(program_num)
-                duration = self._note_mapper.round_duration(instrument, duration)
+        else:
+            pass
 
-                # Round to 2 decimal places
-                duration = self._round_to_sixteenth_note(duration)
+    def _convert_played_notes(self):
+        """
+        Adds a textual representation of every played note to this instance's text sequence. Each distinct combination
+        of duration, note and program is only converted once.
+        :return: None.
+        """
+        representations = {}
+        for (start_tick, duration, note, program_num) in self._played_notes:
+            key = (duration, note, program_num)
+            if key in representations:
+                representation = representations[key]
+            else:
+                representation = self._get_note_representation(duration, note, program_num)
 
-                # Convert MIDI note name to name of instrument or octave/pitch name (depending on program)
-                note_symbol = self._note_mapper.get_note_name(note, program_num)
-                if note_symbol is not None:
-                    # Concatenate instrument, note name and duration to create textual representation
-                    # TODO replace underscore with constant/variable from note_mapping
-                    # TODO allow customization of extracted note properties
-                    representation = "{}_{}_{}".format(instrument, note_symbol, duration)
+                # Failed conversions are not memoized, so that the note mapper keeps logging every failure
+                if representation is not None:
+                    representations[key] = representation
 
-                    # Add note to the textual sequence representation
-                    self._text_sequence[start_tick].append(representation)
+            if representation is not None:
+                # Add note to the textual sequence representation
+                self._text_sequence[start_tick].append(representation)
 
-            # Remove from on notes
-            del self._on_notes[note]
+    def _get_note_representation(self, duration, note, program_num):
+        """
+        Creates the textual representation of a note.
+        :param duration: the duration the note was played for, in MIDI ticks.
+        :param note: the MIDI note (pitch) number.
+        :param program_num: the program the note was played with.
+        :return: the note's textual representation (or None, if the note name could not be determined).
+        """
 
-        else:
-            pass
+        # Convert duration from ticks to quarter notes
+        duration = duration / self._resolution
+
+        # Round duration to nearest step defined for instrument
+        instrument = self._note_mapper.get_program_name(program_num)
+        duration = self._note_mapper.round_duration(instrument, duration)
+
+        # Round to 2 decimal places
+        duration = self._round_to_sixteenth_note(duration)
+
+        # Convert MIDI note name to name of instrument or octave/pitch name (depending on program)
+        note_symbol = self._note_mapper.get_note_name(note, program_num)
+        if note_symbol is None:
+            return None
+
+        # Concatenate instrument, note name and duration to create textual representation
+        # TODO replace underscore with constant/variable from note_mapping
+        # TODO allow customization of extracted note properties
+        return f"{instrument}_{note_symbol}_{duration}"
 
     @staticmethod
     def _quantize(x, base):
@@ -369,56 +485,25 @@ class MidiReader(object):
         return num - (num % divisor)
 
     @staticmethod
-    def _get_value_at_timestamp(values, timestamp):
-        """
-        Searches an ordered dictionary of (timestamp, value) pairs for the value with the greatest timestamp lower than
-        or equal to a given threshold timestamp.
-        :param values: the ordered dictionary to search through.
-        :param timestamp: the cutoff timestamp that the value should occur at or before.
-        :return: the value found.
-        """
-
-        # Default to first element
-        # TODO check if 'values' is empty
-        keys = list(values.keys())
-        value_at_timestamp = values[keys[0]]
-
-        for (index, value) in values.items():
-            if index <= timestamp:
-                # Store value of highest timestamp encountered so far
-                value_at_timestamp = value
-            else:
-                # Since values are sorted by timestamp, end the search early
-                return value_at_timestamp
-
-        return value_at_timestamp
-
-    def _reorder_cols(self, dataframe):
+    def _get_change_indices(timestamps, change_timestamps):
         """
-        Puts all extracted columns into the correct, expected order.
-        :param dataframe: the dataframe whose columns will be reordered.
-        :return: dataframe with reordered columns.
+        For each of the given timestamps, looks up the change with the greatest timestamp lower than or equal to it.
+        :param timestamps: the timestamps to look up.
+        :param change_timestamps: the sorted timestamps of the changes to search through.
+        :return: array with the index of the change in effect at each looked up timestamp. Timestamps preceding all
+        changes are given the index of the first change.
         """
-        correct_col_order = []
-        if self._extract_timestamp:
-            correct_col_order.append('timestamp')
-        if self._extract_bpm:
-            correct_col_order.append('bpm')
-        if self._extract_time_signature:
-            correct_col_order.append('time_signature')
-        if self._extract_measure:
-            correct_col_order.append('measure')
-        if self._extract_beat:
-            correct_col_order.append('beat')
-        correct_col_order.append('notes')
-        return dataframe[correct_col_order]
+        # TODO check if 'change_timestamps' is empty
+        indices = np.searchsorted(change_timestamps, timestamps, side='right') - 1
+        return np.maximum(indices, 0)
 
     def _reset_intermediary_variables(self):
         """
         Clears all stateful variables used during MIDI-to-text conversion.
         :return: None.
         """
-        self._time_signature_by_timestamp = OrderedDict()
-        self._bpm_by_timestamp = OrderedDict()
-        self._text_sequence = defaultdict(list)
-        self._on_notes = {}
+        self._time_signature_by_timestamp.clear()
+        self._bpm_by_timestamp.clear()
+        self._text_sequence.clear()
+        self._on_notes.clear()
+        self._played_notes.clear()
@@ -1,4 +1,6 @@
 import python3_midi
+from collections import defaultdict
+from operator import itemgetter
 
 REST = "rest"
 PERCUSSION = "percussion"
@@ -27,10 +29,13 @@ class MidiWriter(object):
         # MIDI tempo
         self._bpm = DEFAULT_MIDI_BPM
 
-        # Intermediary data stores for tracks, program names and timestamps
+        # Intermediary data stores for tracks and program names
         self._midi_tracks_by_track_num = {}
         self._prog_names_by_track_num = {}
-        self._prev_timestamps_by_track_num = {}
+        self._track_nums_by_prog_name = {}
+
+        # Lowest track number that may still be unused
+        self._next_track_num = 0
 
     def convert_to_midi(self, dataframe, save_to_path):
         """
@@ -45,9 +50,10 @@ class MidiWriter(object):
         # Reset all internal state variables to their defaults
         self._resolution = DEFAULT_MIDI_RESOLUTION
         self._bpm = DEFAULT_MIDI_BPM
-        self._midi_tracks_by_track_num = {}
-        self._prog_names_by_track_num = {}
-        self._prev_timestamps_by_track_num = {}
+        self._midi_tracks_by_track_num.clear()
+        self._prog_names_by_track_num.clear()
+        self._track_nums_by_prog_name.clear()
+        self._next_track_num = 0
 
         # Select average BPM of dataframe as output BPM
         # TODO handle tempo changes throughout the song
@@ -58,71 +64,25 @@ class MidiWriter(object):
         self._add_track(PERCUSSION_CHANNEL, PERCUSSION, pattern)
         self._prog_names_by_track_num[PERCUSSION_CHANNEL] = PERCUSSION
 
-        # Extract notes from each row of the dataframe and record the events to be added
-        midi_events_by_timestamp = {}
-        for index, row in dataframe.iterrows():
-
-            # Each row should represent one 16th note
-            # (which is one quarter of the MIDI resolution)
-            # TODO: make this configurable
-            current_timestamp = int(index * (self._resolution / 4))
-
-            # Note "words" are stored in the 'notes' column
-            note_words = row['notes'].split(",")
-            for note_word in note_words:
-                if note_word != REST:
-
-                    # TODO replace underscore with constant/variable from note_mapping
-                    fields = note_word.split("_")
-
-                    # TODO handle customized note fields
-                    program_name = fields[0]
-                    note_name = fields[1]
-                    note_duration = fields[2]
-
-                    # Check if program_name has already been encountered
-                    if program_name not in self._prog_names_by_track_num.values():
-                        # If not, create a MIDI track for it
-                        program_index = self._get_next_unused_track(self._prog_names_by_track_num)
-                        if program_index >= 0:
-                            self._prog_names_by_track_num[program_index] = program_name
-                            self._add_track(program_index, program_name, pattern)
-
-                    # Get MIDI track for this program
-                    (track_num, midi_track) = self._get_midi_track(program_name)
-                    if midi_track is not None:
-
-                        # Add NoteOn event to events to be added
-                        key = self._note_mapper.get_note_number(note_name)
-                        on_event = python3_midi.NoteOnEvent(velocity=127, pitch=key, channel=track_num)
-                        if current_timestamp in midi_events_by_timestamp:
-                            events = midi_events_by_timestamp[current_timestamp]
-                            events.append(on_event)
-                        else:
-                            events = [on_event]
-                        midi_events_by_timestamp[current_timestamp] = events
-
-                        # Add NoteOff event to events to be added
-                        off_event = python3_midi.NoteOffEvent(pitch=key, channel=track_num)
-                        off_timestamp = current_timestamp + int((float(note_duration) * self._resolution))
-                        if off_timestamp in midi_events_by_timestamp:
-                            events = midi_events_by_timestamp[off_timestamp]
-                            events.append(off_event)
-                        else:
-                            events = [off_event]
-                        midi_events_by_timestamp[off_timestamp] = events
-
-        # Add actual MIDI events to pattern
-        for timestamp in sorted(midi_events_by_timestamp):
-            events = midi_events_by_timestamp[timestamp]
-            for event in events:
-                track_num = event.channel
-                prev_timestamp = self._prev_timestamps_by_track_num[track_num]
-                delta = timestamp - prev_timestamp
-                event.tick = delta
-                midi_track = self._midi_tracks_by_track_num[event.channel]
+        # Extract notes from each row of the dataframe and record the events to be added to each MIDI track
+        # (data frames without a notes column, e.g. from MIDI files that could not be read, contain no notes)
+        midi_events_by_track_num = defaultdict(list)
+        if 'notes' in dataframe.columns:
+            self._add_note_events(dataframe['notes'], pattern, midi_events_by_track_num)
+
+        # Add actual MIDI events to each track
+        for track_num, midi_events in midi_events_by_track_num.items():
+
+            # Sort events by timestamp (the sort is stable, so events sharing a timestamp keep the order they were
+            # added in)
+            midi_events.sort(key=itemgetter(0))
+
+            midi_track = self._midi_tracks_by_track_num[track_num]
+            prev_timestamp = 0
+            for timestamp, event in midi_events:
+                event.tick = timestamp - prev_timestamp
                 midi_track.append(event)
-                self._prev_timestamps_by_track_num[track_num] = timestamp
+                prev_timestamp = timestamp
 
         # Add End-of-track event to every MIDI track
         for track_num, midi_track in self._midi_tracks_by_track_num.items():
@@ -131,16 +91,70 @@ class MidiWriter(object):
         # Write MIDI file to disk
         python3_midi.write_midifile(save_to_path, pattern)
 
+    def _add_note_events(self, notes, pattern, midi_events_by_track_num):
+        """
+        Records the MIDI events for the notes in the given notes column, creating MIDI tracks for newly encountered
+        programs.
+        :param notes: the notes column of the data frame to convert.
+        :param pattern: the MIDI pattern to append newly created tracks to.
+        :param midi_events_by_track_num: the (timestamp, MIDI event) lists to add the events to, by track number.
+        :return: None.
+        """
+
+        # Each row should represent one 16th note
+        # (which is one quarter of the MIDI resolution)
+        # TODO: make this configurable
+        ticks_per_row = self._resolution / 4
+
+        # Note "words" are stored as comma-separated strings in the 'notes' column: split them into one entry per
+        # word, labelled with the index of the row the word came from (the column is cast to objects first, since
+        # empty columns are not stored as strings)
+        note_words = notes.astype(object).str.split(",").explode()
+        note_words = note_words[note_words != REST]
+
+        # TODO replace underscore with constant/variable from note_mapping
+        # TODO handle customized note fields
+        note_fields = note_words.str.split("_")
+        program_names = note_fields.str[0].to_numpy()
+        note_names = note_fields.str[1].to_numpy()
+        note_durations = note_fields.str[2].to_numpy()
+
+        for index, program_name, note_name, note_duration in zip(note_words.index.to_numpy(), program_names,
+                                                                 note_names, note_durations):
+
+            current_timestamp = int(index * ticks_per_row)
+
+            # Check if program_name has already been encountered
+            if program_name not in self._track_nums_by_prog_name:
+                # If not, create a MIDI track for it
+                program_index = self._get_next_unused_track(self._prog_names_by_track_num)
+                if program_index >= 0:
+                    self._prog_names_by_track_num[program_index] = program_name
+                    self._add_track(program_index, program_name, pattern)
+
+            # Get MIDI track for this program
+            (track_num, midi_track) = self._get_midi_track(program_name)
+            if midi_track is not None:
+
+                # Add NoteOn event to events to be added
+                key = self._note_mapper.get_note_number(note_name)
+                on_event = python3_midi.NoteOnEvent(velocity=127, pitch=key, channel=track_num)
+                midi_events_by_track_num[track_num].append((current_timestamp, on_event))
+
+                # Add NoteOff event to events to be added
+                off_event = python3_midi.NoteOffEvent(pitch=key, channel=track_num)
+                off_timestamp = current_timestamp + int((float(note_duration) * self._resolution))
+                midi_events_by_track_num[track_num].append((off_timestamp, off_event))
+
     def _get_midi_track(self, program_name):
         """
         Returns the index and MIDI track for a given MIDI program name.
         :param program_name: the program name to look up.
-        :return: a tuple: (track number, MIDI track) for the program name, or None if none was found.
+        :return: a tuple: (track number, MIDI track) for the program name, or (None, None) if none was found.
         """
-        if program_name not in self._prog_names_by_track_num.values():
-            return None
-        track_num = list(self._prog_names_by_track_num.keys())[
-            list(self._prog_names_by_track_num.values()).index(program_name)]
+        track_num = self._track_nums_by_prog_name.get(program_name)
+        if track_num is None:
+            return None, None
         return track_num, self._midi_tracks_by_track_num[track_num]
 
     def _add_track(self, track_index, program_name, pattern):
@@ -176,16 +190,18 @@ class MidiWriter(object):
 
         pattern.append(track)
         self._midi_tracks_by_track_num[track_index] = track
-        self._prev_timestamps_by_track_num[track_index] = 0
+        self._track_nums_by_prog_name[program_name] = track_index
 
-    @staticmethod
-    def _get_next_unused_track(tracks):
+    def _get_next_unused_track(self, tracks):
         """
-        Gets the lowest unused track number from the given list of MIDI tracks.
+        Gets the lowest unused track number from the given list of MIDI tracks. Since tracks are only ever added during
+        a conversion, the search resumes after the last track number handed out instead of starting over from 0.
         :param tracks: the collection of MIDI tracks already in use.
         :return: the lowest track number available, up to channel 16 or -1 if no unused track numbers are left.
         """
-        for track_index in range(0, 16):
+        while self._next_track_num < 16:
+            track_index = self._next_track_num
+            self._next_track_num += 1
             if track_index not in tracks:
                 return track_index
         return -1
@@ -1,5 +1,11 @@
 import logging
-import json
+from bisect import bisect_left
+
+# Use the faster orjson parser for mapping configurations when it is installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 # Letter notation for music notes
 # TODO: make this configurable, for varying notation systems
@@ -9,6 +15,10 @@ NOTE_NAMES = ["c", "c#", "d", "d#", "e", "f", "f#", "g", "g#", "a", "a#", "b"]
 MAX_MIDI_NOTE_NUM = 127
 MAX_OCTAVE_INDEX = 11
 
+# Note names, indexed by MIDI note number
+NOTE_SYMBOLS = tuple(n + str(octave) for octave in range(0, MAX_OCTAVE_INDEX)
+                     for n in NOTE_NAMES)[:MAX_MIDI_NOTE_NUM + 1]
+
 # Internal string constants
 MIDI_TO_TEXT = "midi-to-text"
 TEXT_TO_MIDI = "text-to-midi"
@@ -18,7 +28,9 @@ DURATIONS = "durations"
 
 class NoteMapper(object):
     """
-    Mapper object to convert between symbolic (MIDI) notes and their textual representations.
+    Mapper object to convert between symbolic (MIDI) notes and their textual representations. Program names, allowed
+    durations and note numbers are looked up in tables built from the mapping configuration at construction time, so
+    later changes to mappings or duration_values do not affect these lookups.
     """
 
     def __init__(self, path_to_config):
@@ -29,22 +41,31 @@ class NoteMapper(object):
         self._logger = logging.getLogger(__name__)
 
         # Load MIDI mapping configuration
-        with open(path_to_config) as json_data:
+        with open(path_to_config, 'rb') as json_data:
             # TODO: validate JSON
-            self.mappings = json.load(json_data)
+            self.mappings = json_loads(json_data.read())
+
+        # Program names by MIDI program number
+        self._program_names = {int(program_number): program_name
+                               for program_number, program_name in self.mappings[MIDI_TO_TEXT].items()
+                               if program_number.isdigit()}
 
         # Allowed durations by instrument/program
         self.duration_values = self.mappings[DURATIONS]
 
-        # Initialize note names and numbers
-        index = 0
-        self._notes = {}
-        for octave in range(0, MAX_OCTAVE_INDEX):
-            for n in NOTE_NAMES:
-                if index <= MAX_MIDI_NOTE_NUM:
-                    symbol = n + str(octave)
-                    self._notes[index] = symbol
-                    index += 1
+        # Allowed durations by instrument/program, sorted for binary search
+        self._sorted_duration_values = {program: sorted(values) for program, values in self.duration_values.items()}
+
+        # Note names, indexed by MIDI note number
+        self._notes = NOTE_SYMBOLS
+
+        # Reverse lookup of MIDI note numbers by note name. Note names take precedence over percussion names and,
+        # for percussion names mapped from several MIDI notes, the first mapping takes precedence
+        self._note_numbers = {}
+        for drum_number, symbolic_name in self.mappings[MIDI_TO_TEXT][PERCUSSION].items():
+            self._note_numbers.setdefault(symbolic_name, int(drum_number))
+        for note_number, symbolic_name in enumerate(self._notes):
+            self._note_numbers[symbolic_name] = note_number
 
         # Log note lookup failures for later inspection
         self._note_lookup_failures = {}
@@ -56,10 +77,22 @@ class NoteMapper(object):
         :param duration: the raw duration value to round, in quarter notes.
         :return: the rounded duration value.
         """
-        if program in self.duration_values:
-            allowed_values = self.duration_values[program]
-            rounded = min(allowed_values, key=lambda x: abs(x - duration))
-            return rounded
+        if program in self._sorted_duration_values:
+            allowed_values = self._sorted_duration_values[program]
+
+            # Find the allowed values directly below and above the duration
+            index = bisect_left(allowed_values, duration)
+            if index == 0:
+                return allowed_values[0]
+            if index == len(allowed_values):
+                return allowed_values[-1]
+            lower = allowed_values[index - 1]
+            upper = allowed_values[index]
+
+            # Round down if the duration lies exactly halfway between both values
+            if duration - lower <= upper - duration:
+                return lower
+            return upper
         else:
             self._logger.error("No duration mapping defined for: {}".format(program))
         return 0
@@ -71,7 +104,7 @@ class NoteMapper(object):
         :return: the program's string representation.
         """
         if program_number >= 0:
-            return self.mappings[MIDI_TO_TEXT][str(program_number)]
+            return self._program_names[program_number]
         else:
             return PERCUSSION
 
@@ -93,7 +126,7 @@ class NoteMapper(object):
         :param program_number: the program the note is played on.
         :return: the note's string representation (or None, if it could not be determined).
         """
-        if program_number >= 0 and note_number in self._notes:
+        if program_number >= 0 and 0 <= note_number <= MAX_MIDI_NOTE_NUM:
             return self._notes[note_number]
         elif str(note_number) in self.mappings[MIDI_TO_TEXT][PERCUSSION]:
             return self.mappings[MIDI_TO_TEXT][PERCUSSION][str(note_number)]
@@ -105,15 +138,9 @@ class NoteMapper(object):
         """
         Returns the MIDI note number for the given symbolic note name.
         :param note_name: the note name to look up.
-        :return: the corresponding MIDI note number.
+        :return: the corresponding MIDI note number (or -1, if the note name is unknown).
         """
-        for note_number, symbolic_name in self._notes.items():
-            if symbolic_name == note_name:
-                return note_number
-        for drum_number, symbolic_name in self.mappings[MIDI_TO_TEXT][PERCUSSION].items():
-            if symbolic_name == note_name:
-                return int(drum_number)
-        return -1
+        return self._note_numbers.get(note_name, -1)
 
     def get_note_lookup_failures(self):
         """
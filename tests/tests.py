@@ -1,6 +1,13 @@
+import os
+import tempfile
 import unittest
 
-from midi_to_dataframe import NoteMapper, MidiReader
+import numpy as np
+import pandas as pd
+import python3_midi
+
+from midi_to_dataframe import NoteMapper, MidiReader, MidiWriter
+from midi_to_dataframe.midi_reader import NoteLength
 
 MIDI_FILE_1 = "resources/midi/Bomfunk_MCs_-_Freestyler.mid"
 
@@ -23,6 +30,113 @@ class MidiReaderTests(unittest.TestCase):
         dataframe = self.reader.convert_to_dataframe(MIDI_FILE_1)
         self.assertTrue(dataframe.shape[0] > 0)
 
+    def test_measure_and_beat_counting(self):
+        # Sixteenth note quantization, changing from 2/4 to 3/8 (which always starts a new measure)
+        numerators = np.array([2] * 10 + [3] * 8)
+        denominators = np.array([4] * 10 + [8] * 8)
+        measures, beats = self.reader._count_measures_and_beats(numerators, denominators)
+        self.assertEqual(measures.tolist(), [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 3, 3, 3, 3, 3, 3, 4, 4])
+        self.assertEqual(beats.tolist(), [1.0, 1.25, 1.5, 1.75, 2.0, 2.25, 2.5, 2.75, 1.0, 1.25,
+                                          1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 1.0, 1.5])
+
+        # Quarter note quantization counts beat units at double rate
+        self.reader._timing_quantization_ratio = NoteLength.QUARTER.value
+        numerators = np.array([3] * 5 + [2] * 4)
+        denominators = np.array([4] * 5 + [2] * 4)
+        measures, beats = self.reader._count_measures_and_beats(numerators, denominators)
+        self.assertEqual(measures.tolist(), [1, 1, 1, 2, 2, 3, 3, 4, 4])
+        self.assertEqual(beats.tolist(), [1.0, 2.0, 3.0, 1.0, 2.0, 1.0, 2.0, 1.0, 2.0])
+
+    def test_change_indices(self):
+        indices = MidiReader._get_change_indices([0, 480, 600, 960, 1200], [0, 500, 960])
+        self.assertEqual(indices.tolist(), [0, 0, 1, 2, 2])
+
+        # Timestamps before the first change are given the first change
+        indices = MidiReader._get_change_indices([0, 240, 480], [240])
+        self.assertEqual(indices.tolist(), [0, 0, 0])
+
+
+class MidiWriterTests(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(MidiWriterTests, self).__init__(*args, **kwargs)
+
+        # Prepare tests objects
+        note_mapping_config_path = "resources/config/map-to-group.json"
+        note_mapper = NoteMapper(note_mapping_config_path)
+        self.writer = MidiWriter(note_mapper)
+
+    def _write_midi(self, dataframe):
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_path = os.path.join(output_dir, "output.mid")
+            self.writer.convert_to_midi(dataframe, output_path)
+            return python3_midi.read_midifile(output_path)
+
+    def test_empty_dataframe(self):
+        # Data frames of MIDI files that could not be read only produce the percussion track
+        pattern = self._write_midi(pd.DataFrame())
+        self.assertEqual(len(pattern), 1)
+
+        pattern = self._write_midi(pd.DataFrame({'notes': []}))
+        self.assertEqual(len(pattern), 1)
+
+    def test_note_events(self):
+        dataframe = pd.DataFrame({'notes': ["piano_c4_1.0,percussion_snare_0.5", "rest", "piano_e4_0.25"]})
+        pattern = self._write_midi(dataframe)
+        pattern.make_ticks_abs()
+
+        # One track for percussion and one for piano
+        self.assertEqual(len(pattern), 2)
+
+        # Each row is one 16th note, i.e. 30 ticks at the default resolution of 120 ticks per quarter note
+        piano_events = [(type(event).__name__, event.data[0], event.tick) for event in pattern[1]
+                        if isinstance(event, (python3_midi.NoteOnEvent, python3_midi.NoteOffEvent))]
+        self.assertEqual(piano_events, [("NoteOnEvent", 48, 0), ("NoteOnEvent", 52, 60),
+                                        ("NoteOffEvent", 52, 90), ("NoteOffEvent", 48, 120)])
+
+        drum_events = [(type(event).__name__, event.data[0], event.tick) for event in pattern[0]
+                       if isinstance(event, (python3_midi.NoteOnEvent, python3_midi.NoteOffEvent))]
+        self.assertEqual(drum_events, [("NoteOnEvent", 40, 0), ("NoteOffEvent", 40, 60)])
+
+
+class NoteMapperTests(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(NoteMapperTests, self).__init__(*args, **kwargs)
+
+        # Prepare tests objects
+        note_mapping_config_path = "resources/config/map-to-group.json"
+        self.note_mapper = NoteMapper(note_mapping_config_path)
+
+    def test_note_number_lookup(self):
+        self.assertEqual(self.note_mapper.get_note_number("c0"), 0)
+        self.assertEqual(self.note_mapper.get_note_number("g10"), 127)
+        self.assertEqual(self.note_mapper.get_note_number("snare"), 40)
+
+        # Percussion names mapped from several MIDI notes resolve to the first mapping
+        self.assertEqual(self.note_mapper.get_note_number("crashcymbal"), 49)
+
+        self.assertEqual(self.note_mapper.get_note_number("unknown"), -1)
+
+    def test_mappings_not_shared(self):
+        # Every instance gets its own copy of the mappings
+        self.note_mapper.duration_values["piano"].append(1000)
+        other_note_mapper = NoteMapper("resources/config/map-to-group.json")
+        self.assertNotIn(1000, other_note_mapper.duration_values["piano"])
+
+    def test_lookup_tables_built_at_construction(self):
+        # Changes to the mappings after construction do not affect lookups, regardless of earlier lookups
+        self.note_mapper.duration_values["piano"].append(1000)
+        self.assertEqual(self.note_mapper.round_duration("piano", 900), 16)
+
+    def test_duration_rounding(self):
+        self.assertEqual(self.note_mapper.round_duration("piano", 0.1), 0.25)
+        self.assertEqual(self.note_mapper.round_duration("piano", 1.3), 1.25)
+        self.assertEqual(self.note_mapper.round_duration("piano", 100), 16)
+
+        # Durations halfway between two allowed values are rounded down
+        self.assertEqual(self.note_mapper.round_duration("piano", 2.75), 2.5)
+
 
 def main():
     unittest.main()